@@ -0,0 +1,60 @@
+"""
+Queries per second of the calibration model, one at a time and batched.
+
+Run from the repository root:
+    python -m benchmarks.bench_calibration --measurements 10000
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+
+from calibration import CalibrationModel
+
+
+def check_hue_wrap():
+    # Two reds on either side of hue 0 must blend to red, not to the cyan halfway around
+    model = CalibrationModel([(1800, .004, 100), (1820, .004, 100), (6500, 0, 100), (6600, 0, 100)],
+                             [(2, 100, 100), (98, 100, 100), (60, 50, 100), (62, 50, 100)], neighbors=2)
+    hue = model.query(1810, 100, .004)[0]
+    if min(hue, 100 - hue) > 2:
+        raise AssertionError(f"Hue between 2 and 98 blended to {hue}")
+
+
+def report(name, duration, count):
+    print(f"{name:<24} {count / duration:12.0f} queries/s {duration / count * 1e6:8.2f} us/query")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark calibration model queries")
+    parser.add_argument('--measurements', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=1000)
+    options = parser.parse_args()
+
+    check_hue_wrap()
+
+    rnd = np.random.default_rng(0)
+    targets = np.stack((rnd.uniform(1800, 8000, options.measurements),
+                        rnd.uniform(-.02, .02, options.measurements),
+                        rnd.uniform(10, 1000, options.measurements)), axis=1)
+    settings = rnd.integers(0, 101, (options.measurements, 3))
+    queries = np.stack((rnd.uniform(2000, 7500, options.queries),
+                        rnd.uniform(-.01, .01, options.queries),
+                        rnd.uniform(50, 800, options.queries)), axis=1)
+
+    start = perf_counter()
+    model = CalibrationModel(targets, settings)
+    print(f"{options.measurements} measurements, built in {(perf_counter() - start) * 1000:.1f} ms")
+
+    start = perf_counter()
+    for cct, delta_uv, lux in queries:
+        model.query(cct, lux, delta_uv)
+    report("query", perf_counter() - start, options.queries)
+
+    start = perf_counter()
+    model.query_batch(queries)
+    report("query_batch", perf_counter() - start, options.queries)
+
+
+if __name__ == "__main__":
+    main()
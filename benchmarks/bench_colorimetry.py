@@ -0,0 +1,71 @@
+"""
+Per-sample cost of batch colorimetry against the per-call CL200A.get_cct path.
+
+Run from the repository root:
+    python -m benchmarks.bench_colorimetry --samples 2000
+"""
+from argparse import ArgumentParser
+from logging import disable, DEBUG
+from time import perf_counter
+
+import numpy as np
+
+from luxmeters.konica import colorimetry
+from luxmeters.konica.CL200A import CL200A
+from luxmeters.simulators import encode_value
+
+
+def per_call(samples, methods):
+    # get_cct as it runs after a measurement, with the serial read replaced by the samples
+    luxmeter = CL200A.__new__(CL200A)
+    readings = iter(samples)
+    luxmeter.get_xyz = lambda trigger=True: next(readings)
+    return [luxmeter.get_cct(methods, trigger=False) for _ in range(len(samples))]
+
+
+def per_call_parse(responses):
+    return [(float(r[10:14]) / 10, float(r[16:20]) / 10, float(r[22:26]) / 10) for r in responses]
+
+
+def report(name, duration, count):
+    print(f"{name:<36} {duration / count * 1e6:10.2f} us/sample {count / duration:12.0f} samples/s")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark batch colorimetry against the per-call path")
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--methods', nargs='+', default=["me_mccamy", "Hernandez 1999"])
+    options = parser.parse_args()
+
+    # The per-call path logs every sample at DEBUG
+    disable(DEBUG)
+
+    rnd = np.random.default_rng(0)
+    # White-ish light around the Planckian locus, as the fixtures produce
+    x = rnd.uniform(.30, .45, options.samples)
+    y = rnd.uniform(.33, .42, options.samples)
+    lux = rnd.uniform(50, 500, options.samples)
+    xyz = np.stack((x / y * lux, lux, (1 - x - y) / y * lux), axis=1).round(1)
+    responses = ['\x020001 000' + ''.join(encode_value(v) for v in row) + '\x0300\r\n' for row in xyz]
+
+    print(f"{options.samples} samples, CCT methods {options.methods}")
+    start = perf_counter()
+    per_call_parse(responses)
+    report("parse, per call", perf_counter() - start, options.samples)
+
+    start = perf_counter()
+    colorimetry.parse_responses(responses)
+    report("parse, batch", perf_counter() - start, options.samples)
+
+    samples = [tuple(row) for row in xyz]
+    start = perf_counter()
+    per_call(samples, options.methods)
+    report("CCT, per call", perf_counter() - start, options.samples)
+
+    start = perf_counter()
+    colorimetry.batch(xyz, methods=options.methods)
+    report("xy, u'v', CCT, duv, batch", perf_counter() - start, options.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Frame rate the effects engine holds on a simulated 115200 baud link, and what it drops to get there.
+
+Run from the repository root:
+    python -m benchmarks.bench_effects --fps 20 60 --duration 2
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+
+import effects
+from neolights_ctl import NeoLightsCtl
+from neolights_sim import TasmotaSimulator
+
+EFFECTS = {
+    "chase": lambda: effects.chase('FF0000', width=4, speed=20),
+    "fade": lambda: effects.fade((10, 10, 10), (40, 30, 20), period=1.),
+    "gradient": lambda: effects.gradient(['FF0000', '00FF00', '0000FF'], speed=.2),
+    "hsb_rotation": lambda: effects.hsb_rotation(speed=.5),
+}
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the effects engine against a simulated lights link")
+    parser.add_argument('--pixels', type=int, default=60)
+    parser.add_argument('--fps', type=float, nargs='+', default=[20, 60])
+    parser.add_argument('--duration', type=float, default=2.)
+    options = parser.parse_args()
+
+    light = NeoLightsCtl(conn=TasmotaSimulator(options.pixels))
+
+    # Render and quantize cost, without the link
+    engine = effects.EffectsEngine(light)
+    out = np.zeros((options.pixels, 3), dtype=np.uint8)
+    for name, make in EFFECTS.items():
+        effect = make()
+        start = perf_counter()
+        for num in range(1000):
+            effect(num / 60, engine._render)
+            engine.quantize(engine._render, out)
+        print(f"{name:<14} render + quantize {(perf_counter() - start) * 1e3:8.1f} us/frame")
+
+    for fps in options.fps:
+        for name, make in EFFECTS.items():
+            stats = effects.EffectsEngine(light, fps=fps).run(make(), duration=options.duration)
+            print(f"{name:<14} target {fps:5.1f} fps  achieved {stats['fps']:5.1f} fps  "
+                  f"dropped {stats['dropped']:4d}  late {stats['late']:4d}  "
+                  f"age p50 {stats['age_p50'] * 1000:6.1f} ms p99 {stats['age_p99'] * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Frame throughput of NeoLightsCtl over a simulated 115200 baud link.
+
+Run from the repository root:
+    python -m benchmarks.bench_frames
+"""
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from neolights_ctl import NeoLightsCtl
+from neolights_sim import TasmotaSimulator
+
+
+def random_frame(rnd, pixels_count):
+    return [(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(pixels_count)]
+
+
+def sparse_update(rnd, frame, changed):
+    frame = list(frame)
+    for num in rnd.sample(range(len(frame)), changed):
+        frame[num] = (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+    return frame
+
+
+def bench(name, light, frames, commit):
+    light.conn.bytes_written = 0
+    light.conn.lines_written = 0
+    start = perf_counter()
+    for frame in frames:
+        commit(frame)
+    duration = perf_counter() - start
+
+    print(f"{name:<28} {len(frames) / duration:10.1f} fps "
+          f"{light.conn.bytes_written / len(frames):10.0f} bytes/frame "
+          f"{light.conn.lines_written / len(frames):8.1f} lines/frame")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark frame commits against a simulated lights link")
+    parser.add_argument('--pixels', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--changed', type=float, default=0.05, help="Share of pixels changed in sparse updates")
+    options = parser.parse_args()
+
+    rnd = Random(0)
+    light = NeoLightsCtl(conn=TasmotaSimulator(options.pixels))
+    full_frames = [random_frame(rnd, options.pixels) for _ in range(options.frames)]
+
+    sparse_frames = list()
+    frame = full_frames[-1]
+    for _ in range(options.frames):
+        frame = sparse_update(rnd, frame, max(1, int(options.pixels * options.changed)))
+        sparse_frames.append(frame)
+
+    def per_pixel(frame):
+        for num, pixel in enumerate(frame):
+            light.set_led(num + 1, "%02X%02X%02X" % pixel)
+
+    print(f"{options.pixels} pixels, {options.frames} frames per case")
+    bench("full frame, set_led", light, full_frames, per_pixel)
+    bench("full frame, set_frame", light, full_frames, light.set_frame)
+    bench("sparse update, set_led", light, sparse_frames, per_pixel)
+    light.set_frame(full_frames[-1])
+    bench("sparse update, set_frame", light, sparse_frames, light.set_frame)
+
+
+if __name__ == "__main__":
+    main()
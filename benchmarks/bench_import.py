@@ -0,0 +1,79 @@
+"""
+Import time of each entry point, from `python -X importtime` in a fresh interpreter.
+
+Run from the repository root:
+    python -m benchmarks.bench_import --output import_times.json
+Pass --compare with an earlier output to see the change per entry point.
+"""
+from argparse import ArgumentParser
+from json import dump, load
+from os import environ, pathsep
+from subprocess import run
+from sys import executable
+
+ENTRY_POINTS = (
+    "luxmeters.logs",
+    "luxmeters.serial_utils",
+    "luxmeters.konica.CL200A",
+    "luxmeters.ut382.ut382",
+    "luxmeters.Sensor",
+    "neolights_ctl",
+    "main",
+)
+
+
+def import_time(module: str, env: dict) -> tuple:
+    """
+    :return: (cumulative import time of the module in us, slowest modules it pulled in as (us, name))
+    """
+    proc = run([executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, env=env)
+    if proc.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    cumulative = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumul, name = line[len("import time:"):].split("|")
+        if cumul.strip().isdigit():
+            cumulative[name.strip()] = int(cumul)
+
+    top = sorted(((us, name) for name, us in cumulative.items() if '.' not in name and name != module),
+                 reverse=True)[:3]
+    return cumulative[module], top
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark import time of the entry points")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per entry point, the best counts")
+    parser.add_argument('--output', help="Write the results as JSON")
+    parser.add_argument('--compare', help="JSON written by an earlier run")
+    options = parser.parse_args()
+
+    env = dict(environ)
+    env["PYTHONPATH"] = pathsep.join(p for p in ("vendor/luxmeters", ".", env.get("PYTHONPATH")) if p)
+
+    previous = dict()
+    if options.compare:
+        with open(options.compare) as f:
+            previous = load(f)
+
+    results = dict()
+    for module in ENTRY_POINTS:
+        runs = [import_time(module, env) for _ in range(options.repeat)]
+        best, top = min(runs)
+        results[module] = best
+
+        change = ""
+        if module in previous:
+            change = f"  ({(best - previous[module]) / 1000:+.1f} ms)"
+        heaviest = ", ".join(f"{name} {us / 1000:.0f} ms" for us, name in top)
+        print(f"{module:<28} {best / 1000:9.1f} ms{change}   heaviest: {heaviest}")
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
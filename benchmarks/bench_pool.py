@@ -0,0 +1,61 @@
+"""
+Frame throughput and commit skew of NeoLightsPool over several simulated 115200 baud links.
+
+Run from the repository root:
+    python -m benchmarks.bench_pool --strips 1 2 4 8
+"""
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from benchmarks.bench_frames import random_frame
+from neolights_ctl import NeoLightsCtl
+from neolights_pool import NeoLightsPool
+from neolights_sim import TasmotaSimulator
+
+
+def percentile(samples, share):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+def bench(strips, options, rnd):
+    lights = [NeoLightsCtl(conn=TasmotaSimulator(options.pixels, seed=num)) for num in range(strips)]
+    frames = [random_frame(rnd, options.pixels * strips) for _ in range(options.frames)]
+
+    # One thread driving the strips one after another
+    start = perf_counter()
+    for frame in frames:
+        for num, light in enumerate(lights):
+            light.set_frame(frame[num * options.pixels:(num + 1) * options.pixels])
+    sequential = perf_counter() - start
+
+    pool = NeoLightsPool(lights)
+    skews = list()
+    start = perf_counter()
+    for frame in frames:
+        pool.set_frame(frame)
+        skews.append(pool.last_skew)
+    pooled = perf_counter() - start
+    pool.close()
+
+    pixels = options.frames * options.pixels * strips
+    print(f"{strips:>2} strips  sequential {pixels / sequential:9.0f} px/s  "
+          f"pool {pixels / pooled:9.0f} px/s ({options.frames / pooled:6.1f} fps)  "
+          f"skew p50 {percentile(skews, .5) * 1000:6.2f} ms p99 {percentile(skews, .99) * 1000:6.2f} ms")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the multi-strip pool against simulated lights links")
+    parser.add_argument('--strips', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--pixels', type=int, default=60, help="Pixels per strip")
+    parser.add_argument('--frames', type=int, default=20, help="Full frames per case")
+    options = parser.parse_args()
+
+    rnd = Random(0)
+    for strips in options.strips:
+        bench(strips, options, rnd)
+
+
+if __name__ == "__main__":
+    main()
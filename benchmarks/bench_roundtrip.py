@@ -0,0 +1,105 @@
+"""
+Round-trip benchmarks of the serial command paths against the device simulators.
+
+Run from the repository root:
+    python -m benchmarks.bench_roundtrip --latency 0.005 --jitter 0.002
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+
+from luxmeters.konica.CL200A import CL200A
+from luxmeters.simulators import CL200ASimulator, UT382Simulator
+from luxmeters.ut382 import ut382
+from neolights_ctl import NeoLightsCtl
+from neolights_sim import TasmotaSimulator
+
+
+def percentile(samples, share):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+def report(name, samples, duration=None):
+    duration = sum(samples) if duration is None else duration
+    print(f"{name:<32} {len(samples) / duration:10.1f} cmd/s "
+          f"p50 {percentile(samples, .5) * 1000:8.2f} ms "
+          f"p99 {percentile(samples, .99) * 1000:8.2f} ms")
+
+
+def timed(func, count):
+    samples = list()
+    start = perf_counter()
+    for num in range(count):
+        t = perf_counter()
+        func(num)
+        samples.append(perf_counter() - t)
+    return samples, perf_counter() - start
+
+
+def bench_lights(options):
+    light = NeoLightsCtl(conn=TasmotaSimulator(latency=options.latency, jitter=options.jitter, seed=0))
+
+    samples, duration = timed(lambda num: light.get_brightness(new_read=True), options.count)
+    report("lights get_brightness", samples, duration)
+
+    samples, duration = timed(lambda num: light.set_color(f"{num % 256:02X}8040"), options.count)
+    report("lights set_color", samples, duration)
+
+    samples, duration = timed(lambda num: light.set_hsb([num % 100, 50, 100]), options.count)
+    report("lights set_hsb", samples, duration)
+    return light
+
+
+def bench_cl200a(options, light):
+    sim = CL200ASimulator(latency=options.latency, jitter=options.jitter, seed=0, timeout=3)
+    luxmeter = CL200A(ser=sim)
+
+    samples, duration = timed(lambda num: luxmeter.get_xyz(), options.sensor_count)
+    report("cl200a get_xyz", samples, duration)
+
+    # XYZ, EV/x/y and EV/TCP/duv of one light state, triggered per value and once for all
+    samples, duration = timed(lambda num: (luxmeter.get_xyz(), luxmeter.get_lux(), luxmeter.get_delta_uv()),
+                              options.sensor_count)
+    report("cl200a 3x get_*", samples, duration)
+
+    samples, duration = timed(lambda num: luxmeter.measure(('01', '02', '08')), options.sensor_count)
+    report("cl200a measure 01+02+08", samples, duration)
+
+    # The sweep as main.TestLights runs it, without the fixed waits
+    start = perf_counter()
+    for num in range(options.sensor_count):
+        light.set_hsb([num % 100, 50, 100])
+        luxmeter.get_delta_uv()
+    duration = perf_counter() - start
+    print(f"{'sweep set_hsb + get_delta_uv':<32} {duration:10.2f} s "
+          f"for {options.sensor_count} points ({duration / options.sensor_count:.3f} s/point)")
+
+
+def bench_ut382(options):
+    sim = UT382Simulator(latency=options.latency, jitter=options.jitter, seed=0, timeout=ut382.timeout)
+    ut382.init(sim.port, conn=sim)
+
+    frames = ut382.live_monitor(ut382.default_timestamp)
+    next(frames)  # Skip the resync
+
+    samples, duration = timed(lambda num: next(frames), options.frames)
+    report("ut382 frames", samples, duration)
+    ut382.cleanup()
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark serial round-trips against the device simulators")
+    parser.add_argument('--latency', type=float, default=.005, help="Device reply latency in seconds")
+    parser.add_argument('--jitter', type=float, default=.002, help="Random extra latency in seconds")
+    parser.add_argument('--count', type=int, default=200, help="Commands per lights case")
+    parser.add_argument('--sensor-count', type=int, default=5, help="Measurements per CL-200A case")
+    parser.add_argument('--frames', type=int, default=16, help="UT382 frames to read")
+    options = parser.parse_args()
+
+    light = bench_lights(options)
+    bench_cl200a(options, light)
+    bench_ut382(options)
+
+
+if __name__ == "__main__":
+    main()
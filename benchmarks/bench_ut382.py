@@ -0,0 +1,93 @@
+"""
+Frames per second the UT382 decoder gets through, on a synthetic capture of the meter's stream.
+
+Run from the repository root:
+    python -m benchmarks.bench_ut382 --frames 20000
+"""
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+import numpy as np
+
+from luxmeters.simulators import encode_ut382_frame
+from luxmeters.ut382 import ut382
+
+
+def make_capture(count, noise, seed=0) -> bytes:
+    """ Frames of changing readings, with stray bytes between some of them as after a dropped byte. """
+    rnd = Random(seed)
+    data = bytearray()
+    for _ in range(count):
+        data += encode_ut382_frame(rnd.choice((0.5, 5, 12.34, 50, 150, 999.9, 5432, 12345)))
+        if rnd.random() < noise:
+            data += bytes(rnd.randrange(256) for _ in range(rnd.randint(1, 8)))
+    return bytes(data)
+
+
+def loop_decoder(capture):
+    # The decoder as it was: listen(33) sized reads, decode_raw and every lcd_table entry per byte
+    luxes = list()
+    for start in range(0, len(capture) - ut382.FRAME_LEN + 1, ut382.FRAME_LEN):
+        reply, err = ut382.decode_raw(list(capture[start:start + ut382.FRAME_LEN]))
+        if err:
+            continue
+        summary = dict()
+        for i, b in enumerate(reply):
+            summary.update(ut382.decode_lcd_byte(i, b))
+        luxes.append(ut382.decode_lux(summary)[0])
+    return luxes
+
+
+def table_decoder(capture, chunk):
+    reader = ut382.FrameReader()
+    luxes = list()
+    for start in range(0, len(capture), chunk):
+        reader.feed(capture[start:start + chunk])
+        while True:
+            lcd = reader.pop()
+            if lcd is None:
+                break
+            luxes.append(ut382.decode_lux(ut382.decode_summary(lcd))[0])
+    return luxes
+
+
+def report(name, duration, count):
+    print(f"{name:<40} {count / duration:12.0f} frames/s {duration / count * 1e6:8.2f} us/frame")
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the UT382 frame decoder")
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--chunk', type=int, default=4096, help="Bytes per read fed to the FrameReader")
+    options = parser.parse_args()
+
+    print(f"{options.frames} frames")
+    clean = make_capture(options.frames, noise=0.)
+    # Both decoders must read the same values, blank leading digits included
+    expected = np.array([np.nan if lux is None else lux for lux in table_decoder(clean, options.chunk)])
+    if not np.allclose(ut382.decode_capture(clean)['lux'], expected, equal_nan=True):
+        raise AssertionError("decode_capture disagrees with decode_summary/decode_lux")
+
+    start = perf_counter()
+    loop_decoder(clean)
+    report("loop decoder, aligned stream", perf_counter() - start, options.frames)
+
+    start = perf_counter()
+    table_decoder(clean, options.chunk)
+    report("table decoder, aligned stream", perf_counter() - start, options.frames)
+
+    # The loop decoder can only resync on a pause in the stream, which a capture does not have
+    noisy = make_capture(options.frames, noise=.01)
+    start = perf_counter()
+    table_decoder(noisy, options.chunk)
+    report("table decoder, 1% frames with noise", perf_counter() - start, options.frames)
+
+    start = perf_counter()
+    decoded = ut382.decode_capture(noisy)
+    report("decode_capture, 1% frames with noise", perf_counter() - start, options.frames)
+    print(f"resyncs {decoded['resyncs']}, errors {decoded['errors']}")
+
+
+if __name__ == "__main__":
+    main()
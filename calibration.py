@@ -0,0 +1,144 @@
+import numpy as np
+
+from measurement_store import load_measurements
+
+TARGET_FIELDS = ("TCP", "deltaUV", "EV")
+# Sensor.record() stores CL200A.get_delta_uv() values, which keep TCP in tens of Kelvin and Δuv in thousandths
+RECORD_SCALE = (10., 1e-3, 1.)
+SETTINGS = ("hsb", "rgb")
+HUE_PERIOD = 100  # NeoLightsCtl.set_hsb hues, 100 is the same red as 0
+
+
+def _settings_of(records: np.ndarray, setting: str) -> tuple:
+    """
+    :return: (settings array of shape (n, 3), mask of the records that have the setting)
+    """
+    if setting == "hsb":
+        values = records["hsb"].astype(np.float64)
+        return values, (values >= 0).all(axis=1)
+
+    colors = records["color_hex"]
+    valid = np.array([len(c) == 6 for c in colors], dtype=bool)
+    values = np.full((len(records), 3), np.nan)
+    if valid.any():
+        raw = np.frombuffer(b''.join(bytes.fromhex(c.decode('ascii')) for c in colors[valid]), dtype=np.uint8)
+        values[valid] = raw.reshape(-1, 3)
+    return values, valid
+
+
+class CalibrationModel:
+    """
+    Inverse of the sweeps: which light setting gives a measured CCT, Δuv and illuminance.
+    Measurements are indexed in a KD-tree over normalized (mired, Δuv, lux),
+    a query interpolates the settings of the nearest measurements by inverse distance.
+    Targets are CCT in Kelvin, Δuv and lux.
+    """
+
+    def __init__(self, targets, settings, setting: str = "hsb", neighbors: int = 4, power: float = 2.):
+        """
+        :param targets: Measured (CCT in Kelvin, Δuv, lux) of each setting, shape (n, 3)
+        :param settings: Light settings, shape (n, 3)
+        :param setting: "hsb" or "rgb", what the settings are
+        :param neighbors: Measurements interpolated between per query
+        :param power: Inverse distance weighting exponent, higher favours the nearest measurement more
+        """
+        if setting not in SETTINGS:
+            raise ValueError(f"Unknown setting {setting}! Supported: {SETTINGS}")
+
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, 3)
+        settings = np.asarray(settings, dtype=np.float64).reshape(-1, 3)
+        if len(targets) != len(settings):
+            raise ValueError("Every target needs its setting!")
+        if not len(targets):
+            raise ValueError("No measurements to build the model from!")
+
+        self.setting = setting
+        self.settings = settings
+        self.neighbors = min(neighbors, len(targets))
+        self.power = power
+
+        # Mireds are closer to perceived colour differences than Kelvin
+        features = self._features(targets)
+        self._mean = features.mean(axis=0)
+        self._scale = features.std(axis=0)
+        self._scale[self._scale == 0] = 1.
+        self.points = (features - self._mean) / self._scale
+
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            self._tree = None
+        else:
+            self._tree = cKDTree(self.points)
+
+    @classmethod
+    def from_measurements(cls, measurements, setting: str = "hsb", record_scale=RECORD_SCALE, **kwargs):
+        """
+        Build the model from sweep results.
+        :param measurements: Path of a MeasurementStore file or its loaded records
+        :param setting: "hsb" or "rgb", which setting of the records to use
+        :param record_scale: Factors turning the recorded TCP, deltaUV and EV into Kelvin, Δuv and lux
+        :param kwargs: See CalibrationModel
+        """
+        records = load_measurements(measurements) if isinstance(measurements, str) else measurements
+        targets = np.stack([records[field].astype(np.float64) for field in TARGET_FIELDS], axis=1)
+        targets *= np.asarray(record_scale, dtype=np.float64)
+        settings, valid = _settings_of(records, setting)
+        # A CCT of 0 is a failed reading, its mired would be infinite
+        valid &= np.isfinite(targets).all(axis=1) & (targets[:, 0] > 0)
+        return cls(targets[valid], settings[valid], setting, **kwargs)
+
+    @staticmethod
+    def _features(targets: np.ndarray) -> np.ndarray:
+        with np.errstate(divide='ignore'):
+            return np.stack((1e6 / targets[:, 0], targets[:, 1], targets[:, 2]), axis=1)
+
+    def _nearest(self, points: np.ndarray) -> tuple:
+        if self._tree is not None:
+            distances, indices = self._tree.query(points, self.neighbors)
+            return distances.reshape(len(points), -1), indices.reshape(len(points), -1)
+
+        distances = np.linalg.norm(points[:, None, :] - self.points[None, :, :], axis=2)
+        indices = np.argpartition(distances, self.neighbors - 1, axis=1)[:, :self.neighbors]
+        return np.take_along_axis(distances, indices, axis=1), indices
+
+    def query_batch(self, targets) -> np.ndarray:
+        """
+        :param targets: (CCT in Kelvin, Δuv, lux) to reach, shape (m, 3)
+        :return: Interpolated settings, shape (m, 3), not rounded
+        """
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, 3)
+        points = (self._features(targets) - self._mean) / self._scale
+        distances, indices = self._nearest(points)
+
+        with np.errstate(divide='ignore'):
+            weights = 1. / distances ** self.power
+        # A target that was measured gets exactly that setting
+        exact = (distances == 0).any(axis=1)
+        weights[exact] = (distances[exact] == 0)
+        weights /= weights.sum(axis=1, keepdims=True)
+        settings = np.einsum('mk,mkc->mc', weights, self.settings[indices])
+
+        if self.setting == "hsb":
+            # Hue wraps around, hues 2 and 98 average to red, not to 50
+            angles = self.settings[indices, 0] * (2 * np.pi / HUE_PERIOD)
+            hue = np.arctan2(np.einsum('mk,mk->m', weights, np.sin(angles)),
+                             np.einsum('mk,mk->m', weights, np.cos(angles)))
+            settings[:, 0] = hue % (2 * np.pi) * (HUE_PERIOD / (2 * np.pi))
+        return settings
+
+    def query(self, cct: float, lux: float, delta_uv: float = 0.) -> tuple:
+        """
+        :param cct: Correlated colour temperature in Kelvin
+        :param lux: Illuminance
+        :param delta_uv: Distance from the Planckian locus
+        :return: Setting for the target, as ints that can be sent to the lights
+        """
+        hsb_or_rgb = np.round(self.query_batch([(cct, delta_uv, lux)])[0])
+        if self.setting == "hsb":
+            hsb_or_rgb[0] %= HUE_PERIOD
+        top = 100 if self.setting == "hsb" else 255
+        return tuple(int(v) for v in np.clip(hsb_or_rgb, 0, top))
+
+    def __len__(self) -> int:
+        return len(self.points)
@@ -0,0 +1,242 @@
+from threading import Condition, Thread
+from time import perf_counter, sleep
+
+import numpy as np
+
+from luxmeters import metrics
+
+GAMMA = 2.2  # Perceived brightness to LED PWM level
+LUT_SIZE = 4096  # Input levels of the gamma table, finer than 8 bit so dithering has something to work with
+
+
+def to_rgb(color) -> np.ndarray:
+    """ A hex string or (r, g, b) 0-255 color as floats 0-1. """
+    if isinstance(color, str):
+        color = list(bytes.fromhex(color.lstrip('#')))
+    return np.asarray(color, dtype=np.float64) / 255
+
+
+def hsv_to_rgb(hue, saturation, value) -> np.ndarray:
+    """
+    Vectorized colorsys.hsv_to_rgb.
+    :param hue: Array or scalar 0-1
+    :param saturation: Array or scalar 0-1
+    :param value: Array or scalar 0-1
+    :return: Array of shape (n, 3)
+    """
+    hue, saturation, value = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=np.float64))
+                                                   for x in (hue, saturation, value)))
+    sector = np.floor(hue * 6)
+    f = hue * 6 - sector
+    sector = sector.astype(np.intp) % 6
+    p = value * (1 - saturation)
+    q = value * (1 - f * saturation)
+    t = value * (1 - (1 - f) * saturation)
+
+    channels = np.stack((value, q, p, p, t, value))
+    rows = np.arange(len(sector))
+    # Each channel picks from the same six values, shifted by two sectors
+    return np.stack([channels[(sector + shift) % 6, rows] for shift in (0, 4, 2)], axis=1)
+
+
+# Effects are callables taking the frame time in seconds and a (pixels_count, 3) float buffer to render into,
+# with values from 0 to 1 in perceived brightness.
+
+def solid(color):
+    rgb = to_rgb(color)
+
+    def effect(t, out):
+        out[:] = rgb
+    return effect
+
+
+def gradient(colors, speed: float = 0.):
+    """
+    :param colors: Color stops spread evenly along the strip, wrapping around to the first one
+    :param speed: Strip lengths per second the gradient scrolls by
+    """
+    stops = np.array([to_rgb(color) for color in colors] + [to_rgb(colors[0])])
+
+    def effect(t, out):
+        pos = (np.arange(len(out)) / len(out) + speed * t) % 1 * (len(stops) - 1)
+        for channel in range(3):
+            out[:, channel] = np.interp(pos, np.arange(len(stops)), stops[:, channel])
+    return effect
+
+
+def fade(color_from, color_to, period: float = 2.):
+    """ Fade back and forth between two colors, period seconds for a round trip. """
+    start, end = to_rgb(color_from), to_rgb(color_to)
+
+    def effect(t, out):
+        share = (1 - np.cos(2 * np.pi * t / period)) / 2
+        out[:] = start + (end - start) * share
+    return effect
+
+
+def chase(color, background=(0, 0, 0), width: float = 3., speed: float = 10.):
+    """
+    A lit block running along the strip, with soft edges.
+    :param width: Pixels lit
+    :param speed: Pixels per second
+    """
+    lit, dark = to_rgb(color), to_rgb(background)
+
+    def effect(t, out):
+        count = len(out)
+        distance = np.abs((np.arange(count) - speed * t + count / 2) % count - count / 2)
+        share = np.clip(width / 2 + .5 - distance, 0, 1)[:, None]
+        out[:] = dark + (lit - dark) * share
+    return effect
+
+
+def hsb_rotation(saturation: float = 100, brightness: float = 100, speed: float = .1, spread: float = 1.):
+    """
+    Hues rotating along the strip.
+    :param saturation: 0-100 like NeoLightsCtl.set_hsb
+    :param brightness: 0-100 like NeoLightsCtl.set_hsb
+    :param speed: Turns of the color wheel per second
+    :param spread: Turns of the color wheel along the strip
+    """
+    def effect(t, out):
+        hue = (np.arange(len(out)) / len(out) * spread + speed * t) % 1
+        out[:] = hsv_to_rgb(hue, saturation / 100, brightness / 100)
+    return effect
+
+
+class EffectsEngine:
+    """
+    Plays effects on the lights at a steady frame rate.
+    Frames are rendered on the calling thread and sent by a sender thread, through two output buffers:
+    while one is on the wire the next is rendered into the other.
+    When the link falls behind, a newer frame replaces the unsent one, which set_frame then merges
+    into a single update against what the strip shows.
+    """
+
+    def __init__(self, light, fps: float = 30., gamma: float = GAMMA, dither: bool = True):
+        """
+        :param light: NeoLightsCtl, NeoLightsPool or anything with pixels_count and set_frame()
+        :param fps: Target frame rate
+        :param gamma: Gamma of the correction table, 1 to turn it off
+        :param dither: Carry the rounding error of each pixel over to its next frames,
+                       so dim colors get their in-between levels on average
+        """
+        self.light = light
+        self.fps = fps
+        self.dither = dither
+        self.gamma_lut = (np.linspace(0, 1, LUT_SIZE) ** gamma) * 255
+
+        count = light.pixels_count
+        self._render = np.zeros((count, 3))
+        self._error = np.zeros((count, 3))
+        self._buffers = [np.zeros((count, 3), dtype=np.uint8), np.zeros((count, 3), dtype=np.uint8)]
+        self._back_time = None
+        self._ready = False
+        self._running = False
+        self._cond = Condition()
+        self._stats = None
+        self._failure = None
+
+    def quantize(self, frame: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """ Gamma correct and dither a rendered frame into 8 bit levels. """
+        levels = self.gamma_lut[(np.clip(frame, 0, 1) * (LUT_SIZE - 1) + .5).astype(np.intp)]
+        if not self.dither:
+            out[:] = np.floor(levels + .5)
+            return out
+
+        wanted = levels + self._error
+        out[:] = np.clip(np.floor(wanted + .5), 0, 255)
+        self._error = wanted - out
+        return out
+
+    def _publish(self, rendered_at: float):
+        with self._cond:
+            if self._ready:
+                # The link did not take the last frame yet, this one replaces it
+                self._stats["dropped"] += 1
+                metrics.count("effects.dropped")
+            self.quantize(self._render, self._buffers[1])
+            self._back_time = rendered_at
+            self._ready = True
+            self._cond.notify()
+
+    def _send(self):
+        try:
+            self._send_frames()
+        except Exception as err:
+            # Handed back to run(), which stops rendering
+            self._failure = err
+
+    def _send_frames(self):
+        while True:
+            with self._cond:
+                while not self._ready and self._running:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                self._buffers.reverse()
+                self._ready = False
+                rendered_at = self._back_time
+
+            self.light.set_frame(self._buffers[0])
+            age = perf_counter() - rendered_at
+            self._stats["sent"] += 1
+            self._stats["ages"].observe(age)
+            metrics.observe("effects.frame_age", age)
+
+    def run(self, effect, duration: float = None, frames: int = None) -> dict:
+        """
+        Play an effect.
+        :param effect: Callable taking (t, out), see the effects in this module
+        :param duration: Seconds to play, endless if neither duration nor frames are given
+        :param frames: Frame ticks to play
+        :return: Dict with target and achieved fps, rendered, sent, dropped and late frames,
+                 p50 and p99 of the time from render to sent in seconds, and duration.
+                 An exception raised by the light's set_frame stops the effect and is raised here.
+        """
+        period = 1. / self.fps
+        self._stats = {"rendered": 0, "sent": 0, "dropped": 0, "late": 0, "ages": metrics.Histogram()}
+        self._failure = None
+        self._running = True
+        sender = Thread(target=self._send, daemon=True)
+        sender.start()
+
+        start = perf_counter()
+        tick = 0
+        try:
+            while (frames is None or tick < frames) and (duration is None or tick * period < duration):
+                if self._failure is not None:
+                    break
+                deadline = start + tick * period
+                now = perf_counter()
+                if now < deadline:
+                    sleep(deadline - now)
+                elif now - deadline >= period:
+                    # Rendering fell behind, skip the ticks that are already over
+                    missed = int((now - deadline) / period)
+                    self._stats["late"] += missed
+                    metrics.count("effects.late", missed)
+                    tick += missed
+                    continue
+
+                effect(tick * period, self._render)
+                self._stats["rendered"] += 1
+                self._publish(perf_counter())
+                tick += 1
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify()
+            sender.join()
+
+        if self._failure is not None:
+            raise self._failure
+        elapsed = perf_counter() - start
+        ages = self._stats.pop("ages")
+        stats = dict(self._stats)
+        stats["target_fps"] = self.fps
+        stats["fps"] = stats["sent"] / elapsed if elapsed else 0.
+        stats["age_p50"] = ages.percentile(.5)
+        stats["age_p99"] = ages.percentile(.99)
+        stats["duration"] = elapsed
+        return stats
@@ -1,6 +1,14 @@
-from time import sleep
+from itertools import islice
+from os import environ
+from time import time
 
+from measurement_store import MeasurementStore
 from neolights_ctl import NeoLightsCtl
+from sampling import Checkpoint, GridStrategy, record_values
+from settle import SettleDetector
+from sweep_engine import SweepEngine
+from luxmeters import metrics
+from luxmeters.logs import setup_logging
 from luxmeters.serial_utils import list_ports
 from luxmeters.Sensor import Sensor
 
@@ -11,169 +19,211 @@ def int_to_str(num):
 
 
 class TestLights:
-    def __init__(self, light, sensor=None):
+    def __init__(self, light, sensor=None, settle=None, sensors=None, store="measurements.bin"):
+        """
+        :param light: NeoLightsCtl
+        :param sensor: Sensor, read for the measurements
+        :param settle: SettleDetector deciding when a point can be measured
+        :param sensors: Dict of name: Sensor for measuring every point with several meters at once
+        :param store: MeasurementStore or path of the file to stream the measurements to, appended to if it exists
+        """
         print(f"Initialising Test measurement")
 
         # if not sensor:
         #     raise ValueError("Sensor is required!")
-        self.sensor = sensor
+        # The main sensor goes first, it is the one watched for settling
+        self.sensors = {sensor.model: sensor} if sensor else dict()
+        if sensors:
+            self.sensors.update(sensors)
+        self.sensor = sensor if sensor else next(iter(self.sensors.values()), None)
 
         if not light:
             raise ValueError("Light is required!")
         self.light = light
 
-        self.measurements = list()
+        self.settle = settle if settle else SettleDetector()
 
-    def grab_data(self, color=None, hsb=None):
+        self.measurements = store if isinstance(store, MeasurementStore) else MeasurementStore(store)
+
+    def grab_data(self, color=None, hsb=None, data=None, settle_time=None):
         if not self.sensor:
             print("Error! Trying to get sensor data without configured sensor!")
             return
 
-        data = self.sensor.get('delta_uv')
-        if data[1] < 0:
+        if data is None:
+            data = self.sensor.record(trigger=True)
+        if data.get("TCP", 0) < 0:
             return -1
 
-        new_data = {
-            "EV": data[0],
-            "TCP": data[1],
-            "deltaUV": data[2]
-        }
+        new_data = dict(data)
+        new_data.setdefault("timestamp", time())
 
         if color:
             new_data["color_hex"] = color
         if hsb:
             new_data["hsb"] = hsb
+        if settle_time is not None:
+            new_data["settle_time"] = settle_time
 
         print(f"Measured: {new_data}")
         self.measurements.append(new_data)
 
+    def apply(self, point: dict):
+        if "color" in point:
+            print(f"Setting color {point['color']}")
+            self.light.set_color(point["color"])
+        else:
+            print(f"Setting HSB to {point['hsb']}")
+            self.light.set_hsb(point["hsb"])
+
+    def sweep(self, points, action=None, tests_num=0, on_done=None) -> dict:
+        """
+        Set the light to every point and measure it with all sensors, see SweepEngine.
+        :param points: Iterable of dicts with either color or hsb
+        :param action: Callable taking the point, data and settle_time keyword arguments, None to only cycle the light
+        :param tests_num: Total number of points for the progress output, 0 if not known
+        :param on_done: Callable taking (point, data) after each point, data is None for rejected results
+        :return: Sweep stats
+        """
+        test_counter = [0]
+
+        def on_record(point, data, settle_time):
+            # After change do...
+            res = action(data=data, settle_time=settle_time, **point) if action else 1
+
+            if res != -1:
+                test_counter[0] += 1
+                print(f"Test {test_counter[0]}/{tests_num if tests_num else '?'} saved")
+            else:
+                print("Results are not logical! Not counting this test!")
+
+            if on_done:
+                on_done(point, data if res != -1 else None)
+            return res
+
+        engine = SweepEngine(self.sensors if action else None, self.settle, on_record)
+        try:
+            stats = engine.run(points, self.apply)
+        finally:
+            engine.close()
+
+        print(f"{stats['points']} points in {stats['duration']:.1f} sec")
+        metrics.export()
+        return stats
+
+    def sampled_sweep(self, strategy, to_point, from_point, action=None, checkpoint_path=None, tests_num=0) -> dict:
+        """
+        Sweep the points a sampling strategy picks, feeding the measurements back to it.
+        :param strategy: sampling.Strategy yielding coordinates
+        :param to_point: Callable turning coordinates into a point for sweep()
+        :param from_point: Callable turning a point back into coordinates
+        :param action: See sweep()
+        :param checkpoint_path: File to record the finished points in and to resume from
+        :param tests_num: Stop after this many new points, 0 for when the strategy ends
+        :return: Sweep stats
+        """
+        checkpoint = Checkpoint(checkpoint_path, strategy.describe()) if checkpoint_path else None
+        if checkpoint:
+            for coords, values in checkpoint.done.items():
+                strategy.feed(coords, values)
+
+        def points():
+            for coords in strategy:
+                if checkpoint and coords in checkpoint:
+                    continue
+                yield to_point(coords)
+
+        def on_done(point, data):
+            coords = from_point(point)
+            values = record_values(data)
+            strategy.feed(coords, values)
+            if checkpoint:
+                checkpoint.add(coords, values)
+
+        try:
+            return self.sweep(islice(points(), tests_num) if tests_num else points(), action, tests_num, on_done)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
     def go_through_colors_list(self, colors_list: list, action=None):
-        test_counter = 0
         colors_num = len(colors_list)
 
         print()
         print("------------------------------")
         print(f"Starting colors list... ({colors_num} tests)")
 
-        for color in colors_list:
-            print(f"Setting color {color}")
-
-            self.light.set_color(color)
-            print("Waiting 1.5 sec for the sensor to load...")
-            sleep(1.5)
-
-            # After change do...
-            res = 1
-            if action and self.sensor:
-                res = action(color=color)
-
-            if res != -1:
-                test_counter += 1
-                print(f"Test {test_counter}/{colors_num} saved")
-            else:
-                print("Results are not logical! Not counting this test!")
-
-            sleep(.5)
+        self.sweep(({"color": color} for color in colors_list), action, colors_num)
 
         print("List ended!")
         print("------------------------------")
 
-    def cycle_colors(self, action=None):
+    def cycle_colors(self, action=None, strategy=None, checkpoint_path=None):
+        """
+        :param strategy: sampling.Strategy over (red, green, blue), coarse-to-fine grid over 150-254 by default
+        :param checkpoint_path: File to resume the cycle from
+        """
         # self.light.set_brightness(100)
-        test_counter = 0
         tests_num = 0  # 0 for infinite
 
+        if not strategy:
+            strategy = GridStrategy([(150, 254)] * 3)
+
         print()
         print("------------------------------")
-        print(f"Starting colors cycle... ({tests_num-1 if tests_num else 'infinite'} tests)")
-
-        for blue in range(150, 255):
-            for green in range(150, 255):
-                for red in range(150, 255):
-                    if tests_num != 0 and test_counter > tests_num:
-                        break
+        print(f"Starting colors cycle... ({tests_num if tests_num else 'infinite'} tests, {strategy.name} sampling)")
 
-                    red_hex = format(red, 'X').ljust(2, '0')
-                    green_hex = format(green, 'X').ljust(2, '0')
-                    blue_hex = format(blue, 'X').ljust(2, '0')
-
-                    color_hex = f"{red_hex}{green_hex}{blue_hex}"
-
-                    # if blue % 9 == 0:
-                    print(f"Setting color {color_hex}")
-
-                    self.light.set_color(color_hex)
-                    print("Waiting 1.5 sec for the sensor to load...")
-                    sleep(1.5)
-
-                    # After change do...
-                    res = 1
-                    if action and self.sensor:
-                        res = action(color=color_hex)
-
-                    if res != -1:
-                        test_counter += 1
-
-                        print(f"Test {test_counter}/{tests_num} saved")
-                    else:
-                        print("Results are not logical! Not counting this test!")
-
-                    sleep(.5)
-                    # else:
-                    #     print(f"Skipping {color_hex}...")
+        self.sampled_sweep(
+            strategy,
+            lambda coords: {"color": "%02X%02X%02X" % coords},
+            lambda point: tuple(int(point["color"][i:i + 2], 16) for i in (0, 2, 4)),
+            action, checkpoint_path, tests_num,
+        )
 
         print("Cycling ended!")
         print("------------------------------")
 
-    def cycle_hsb(self, action=None):
-        test_counter = 0
+    def cycle_hsb(self, action=None, strategy=None, checkpoint_path=None):
+        """
+        :param strategy: sampling.Strategy over (hue, saturation), coarse-to-fine grid over 0-99 by default
+        :param checkpoint_path: File to resume the cycle from
+        """
         tests_num = 0  # 0 for infinite
 
+        if not strategy:
+            strategy = GridStrategy([(0, 99)] * 2)
+
         print()
         print("------------------------------")
-        print(f"Starting colors cycle... ({tests_num-1 if tests_num else 'all'} tests)")
+        print(f"Starting colors cycle... ({tests_num if tests_num else 'all'} tests, {strategy.name} sampling)")
 
         target_brightness = 100
 
-        for hue in range(0, 100):
-            for saturation in range(0, 100):
-                if tests_num != 0 and test_counter > tests_num:
-                    break
-
-                hsb = [hue, saturation, target_brightness]
-
-                # if blue % 9 == 0:
-                print(f"Setting HSB to [{hue}, {saturation}, {target_brightness}]")
-
-                self.light.set_hsb(hsb)
-                print("Waiting 1.5 sec for the sensor to load...")
-                sleep(1.5)
-
-                # After change do...
-                res = 1
-                if action and self.sensor:
-                    res = action(hsb=hsb)
-
-                if res != -1:
-                    test_counter += 1
-
-                    print(f"Test {test_counter}/{tests_num} saved")
-                else:
-                    print("Results are not logical! Not counting this test!")
-
-                sleep(.5)
+        self.sampled_sweep(
+            strategy,
+            lambda coords: {"hsb": [coords[0], coords[1], target_brightness]},
+            lambda point: tuple(point["hsb"][:2]),
+            action, checkpoint_path, tests_num,
+        )
 
         print("Cycling ended!")
         print("------------------------------")
 
     def __del__(self):
         print("exiting...")
-        print(f"Measured data: \n{self.measurements}")
-        measured_colors = [d['color_hex'] for d in self.measurements if 'color_hex' in d]
-        print(f"colors list: \n{measured_colors}")
+        self.measurements.close()
+        print(f"{len(self.measurements)} measurements in {self.measurements.path}, "
+              f"load them with measurement_store.load_measurements()")
 
 
 def main():
+    setup_logging()
+
+    # NEOLIGHTS_METRICS=metrics.txt writes where the sweep time goes after every sweep
+    if environ.get("NEOLIGHTS_METRICS"):
+        metrics.enable()
+        metrics.add_exporter(metrics.TextFileExporter(environ["NEOLIGHTS_METRICS"]))
+
     print(list_ports())
 
     light = NeoLightsCtl()
@@ -181,15 +231,16 @@ def main():
     light.set_brightness(100)
 
     # s = Sensor(model="cl200a")
+    # u = Sensor(model="ut382")
 
     # print(s.get('all'))
 
-    testing = TestLights(light=light)  # , sensor=s)
+    testing = TestLights(light=light)  # , sensor=s, sensors={"ut382": u})
 
     # colors_list = ['969696', 'D79696', 'D89696', 'D99696', 'DA9696', 'DB9696', 'DC9696', 'DD9696', 'DE9696', 'DF9696', 'E09696', 'E19696', 'E29696', 'E39696', 'E49696', 'E59696', 'E69696', 'E79696', 'E89696', 'E99696', 'EA9696']
-    # testing.go_through_colors_list(testing.grab_data, colors_list)
+    # testing.go_through_colors_list(colors_list, testing.grab_data)
 
-    testing.cycle_hsb()
+    testing.cycle_hsb()  # (testing.grab_data, RefineStrategy([(0, 99)] * 2), "cycle_hsb.checkpoint")
 
     # testing.cycle_colors(testing.grab_data)
 
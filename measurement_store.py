@@ -0,0 +1,116 @@
+from json import dumps, loads
+from os import fsync, truncate
+from os.path import exists, getsize
+
+import numpy as np
+
+# Fields not in a record stay NaN (floats), -1 (hsb) or empty (color_hex)
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("color_hex", "S6"),
+    ("hsb", "<i2", (3,)),
+    ("EV", "<f8"),
+    ("TCP", "<f8"),
+    ("deltaUV", "<f8"),
+    ("XYZ", "<f8", (3,)),
+    ("settle_time", "<f4"),
+    ("ut382_lux", "<f8"),
+])
+
+
+def _dtype_to_json(dtype: np.dtype) -> str:
+    return dumps([list(field) for field in dtype.descr])
+
+
+def _dtype_from_json(descr: str) -> np.dtype:
+    return np.dtype([tuple(field[:2]) + ((tuple(field[2]),) if len(field) > 2 else ()) for field in loads(descr)])
+
+
+def _empty_row(dtype: np.dtype) -> np.ndarray:
+    row = np.zeros(1, dtype)
+    for name in dtype.names:
+        kind = dtype[name].base.kind
+        if kind == 'f':
+            row[name] = np.nan
+        elif kind == 'i':
+            row[name] = -1
+    return row
+
+
+class MeasurementStore:
+    """
+    Append-only measurement file of fixed size NumPy records, written as they arrive.
+    The file is the raw structured array, so it can be memory mapped as it is;
+    its dtype is kept in a <path>.json sidecar.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype = RECORD_DTYPE, sync: bool = False):
+        """
+        :param path: Data file, appended to if it exists
+        :param dtype: Structured dtype of the records, has to match the one of an existing file
+        :param sync: fsync after every record, survives power loss and not just a crash
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.sync = sync
+        self._empty = _empty_row(self.dtype)
+
+        meta_path = f"{path}.json"
+        if exists(meta_path):
+            with open(meta_path) as f:
+                stored = _dtype_from_json(f.read())
+            if stored != self.dtype:
+                raise ValueError(f"{path} holds records of a different dtype: {stored}")
+        else:
+            with open(meta_path, 'w') as f:
+                f.write(_dtype_to_json(self.dtype))
+
+        if exists(path):
+            # Drop a record cut short by a crash
+            size = getsize(path)
+            if size % self.dtype.itemsize:
+                truncate(path, size - size % self.dtype.itemsize)
+
+        self._file = open(path, 'ab')
+        self.count = self._file.tell() // self.dtype.itemsize
+
+    def append(self, record: dict) -> None:
+        row = self._empty.copy()
+        for name, value in record.items():
+            if name in self.dtype.names and value is not None:
+                row[name] = value.encode('ascii') if isinstance(value, str) else value
+
+        self._file.write(row.tobytes())
+        self._file.flush()
+        if self.sync:
+            fsync(self._file.fileno())
+        self.count += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load_measurements(path: str, mmap: bool = True) -> np.ndarray:
+    """
+    Load a measurement file as a structured array.
+    :param path: Data file written by MeasurementStore
+    :param mmap: Map the file instead of reading it, only the pages used get loaded
+    :return: Structured array, read only when mapped
+    """
+    with open(f"{path}.json") as f:
+        dtype = _dtype_from_json(f.read())
+    count = getsize(path) // dtype.itemsize
+    if not count:
+        return np.zeros(0, dtype)
+    if mmap:
+        return np.memmap(path, dtype, mode='r', shape=(count,))
+    return np.fromfile(path, dtype, count)
@@ -1,67 +1,243 @@
 from serial import Serial, SerialException
-from time import sleep
+from time import monotonic
 from json import loads, JSONDecodeError
+from collections import deque
+from threading import Thread, Event, Lock
 
-from luxmeters.serial_utils import list_ports, find_all_luxmeters
+from luxmeters import metrics
+from luxmeters.registry import DeviceKind, get_registry
+from luxmeters.serial_utils import list_ports
 
 
 # from vendor.luxmeters.konica.CL200A import CL200A
 
-
-def _read_response(resp, obj):
+MAX_CMD_LEN = 255  # Tasmota serial input buffer, longer lines get truncated
+MAX_BACKLOG_CMDS = 30  # Tasmota queues at most this many commands per Backlog
+# Backlog0 runs its commands back to back, plain Backlog waits SetOption34 (200 ms by default) between them
+FRAME_BACKLOG = "Backlog0 "
+MERGE_GAP = 1  # Unchanged pixels between two runs that are cheaper to resend than to start a new Led command
+RESPONSE_TIMEOUT = 1.  # Seconds to wait for a reply to a query
+READ_TIMEOUT = .1  # Serial read timeout, bounds how long the reader takes to notice it was stopped
+BOOT_TIMEOUT = 5.  # Seconds to wait for the board to answer after opening the port
+READY_POLL = .25  # Seconds to wait for each "Pixels" query while the board boots
+
+# Tasmota can not be asked what it is without disturbing other CH340 devices, so any CH340 port is taken
+LIGHTS_KIND = DeviceKind('CH340', lambda port: Serial(port, 115200, timeout=READ_TIMEOUT), field='description')
+
+
+def parse_result_line(line: str):
+    """
+    Parse a Tasmota "RESULT = {...}" line.
+    :param line: Line as read from the serial port
+    :return: Dict with the reply or None if the line is not a result
+    """
+    if "RESULT = " not in line:
+        return None
     try:
-        resp = resp.splitlines()
-        if len(resp):
-            # print("We got multiple lines of output!")
-            # print(f"'{resp}'")
-            out = loads(resp[-1].split(' = ')[1])
-        else:
-            out = None
-    except IndexError:
-        try:
-            print("Getting resp failed, retrying...")
-            new_read = obj.read().splitlines()
-            if len(new_read):
-                print("We got multiple lines of output!")
-                print(f"'{new_read}'")
-                out = loads(new_read[-1].split(' = ')[1])
-            else:
-                out = None
-        except IndexError:
-            raise Exception(f"Got: {resp}")
+        return loads(line.split(' = ', 1)[1])
     except JSONDecodeError:
-        print("JSONDecodeError!")
-        raise Exception(f"Got: {resp}")
-    return out
-
-
-def read_response(obj):
-    obj.conn.flush()
-    sleep(.1)
-    return _read_response(obj.read(), obj)
+        metrics.count("lights.decode_errors")
+        print(f"JSONDecodeError! Got: {line.rstrip()}")
+        return None
+
+
+def count_replies(cmd: str) -> int:
+    """ Number of RESULT lines Tasmota sends back for a command line. """
+    if cmd.lower().startswith("backlog"):
+        return len([c for c in cmd.split(' ', 1)[-1].split(';') if c.strip()])
+    return 1
+
+
+class _Pending:
+    __slots__ = ('key', 'deadline', 'event', 'result')
+
+    def __init__(self, key, deadline):
+        self.key = key
+        self.deadline = deadline
+        self.event = Event()
+        self.result = None
+
+
+class ResponseReader(Thread):
+    """
+    Background reader that frames the serial input into lines and hands every
+    RESULT to the command that caused it.
+
+    Tasmota answers commands in the order it got them, so replies are matched
+    against a FIFO of sent commands. Commands nobody waits for still take their
+    place in the queue, so their replies can not be mistaken for a query's one.
+    """
+
+    def __init__(self, conn, timeout: float):
+        super().__init__(daemon=True)
+        self.conn = conn
+        self.timeout = timeout
+        self._pending = deque()
+        self._lock = Lock()
+        self._running = True
+
+    def expect(self, key=None, count=1) -> _Pending:
+        """
+        Register replies before sending the command that causes them.
+        :param key: Key the reply of a query must contain, None for replies nobody waits for
+        :param count: Number of replies expected
+        :return: The last registered entry
+        """
+        deadline = monotonic() + self.timeout
+        with self._lock:
+            for _ in range(count):
+                entry = _Pending(key, deadline)
+                self._pending.append(entry)
+        return entry
+
+    def wait(self, entry: _Pending, timeout: float) -> dict:
+        if not entry.event.wait(timeout):
+            with self._lock:
+                try:
+                    self._pending.remove(entry)
+                except ValueError:
+                    pass
+            if not entry.event.is_set():
+                metrics.count("lights.timeouts")
+                raise TimeoutError(f"No reply with '{entry.key}' in {timeout} sec")
+        return entry.result
+
+    def _dispatch(self, data: dict):
+        with self._lock:
+            now = monotonic()
+            # Drop replies we gave up on
+            while self._pending and self._pending[0].key is None and self._pending[0].deadline < now:
+                self._pending.popleft()
+
+            if not self._pending:
+                return
+
+            head = self._pending[0]
+            if head.key is None or head.key in data or 'Command' in data:
+                self._pending.popleft()
+                head.result = data
+                head.event.set()
+
+    def run(self):
+        line = b''
+        while self._running:
+            try:
+                line += self.conn.readline()
+            except (SerialException, OSError, TypeError):
+                break
+            if not line.endswith(b'\n'):
+                continue
+
+            data = parse_result_line(line.decode('ascii', errors='replace'))
+            line = b''
+            if data is not None:
+                self._dispatch(data)
+
+    def stop(self):
+        self._running = False
+
+
+def pixel_to_hex(pixel) -> str:
+    """
+    Convert a pixel given as hex string or (r, g, b) into Tasmota's RRGGBB format.
+    """
+    if isinstance(pixel, str):
+        return pixel.lstrip('#').upper()
+    r, g, b = pixel
+    return f"{int(r):02X}{int(g):02X}{int(b):02X}"
+
+
+def diff_frame(old, new) -> list:
+    """
+    Find the pixels that differ between two frames of hex colors.
+    :param old: Last committed frame or None if unknown
+    :param new: Frame to be committed
+    :return: List of (start, colors) runs, start is 0 based
+    """
+    runs = list()
+    for num, color in enumerate(new):
+        if old is not None and old[num] == color:
+            continue
+
+        if runs:
+            start, colors = runs[-1]
+            gap = num - (start + len(colors))
+            if gap <= MERGE_GAP:
+                colors.extend(new[num - gap:num + 1])
+                continue
+
+        runs.append((num, [color]))
+
+    return runs
+
+
+def pack_led_cmds(runs) -> list:
+    """
+    Pack runs of changed pixels into as few serial lines as the firmware allows.
+    :param runs: List of (start, colors) as returned by diff_frame
+    :return: List of command lines
+    """
+    cmds = list()
+    for start, colors in runs:
+        cmd = f"Led{start + 1}"
+        for num, color in enumerate(colors):
+            if len(cmd) + len(color) + 1 > MAX_CMD_LEN:
+                cmds.append(cmd)
+                cmd = f"Led{start + num + 1}"
+            cmd += f" {color}"
+        cmds.append(cmd)
+
+    lines = list()
+    batch = list()
+    batch_len = len(FRAME_BACKLOG)
+    for cmd in cmds:
+        if batch and (batch_len + len(cmd) + 1 > MAX_CMD_LEN or len(batch) == MAX_BACKLOG_CMDS):
+            lines.append(batch)
+            batch = list()
+            batch_len = len(FRAME_BACKLOG)
+        batch.append(cmd)
+        batch_len += len(cmd) + 1
+    if batch:
+        lines.append(batch)
+
+    return [batch[0] if len(batch) == 1 else FRAME_BACKLOG + ";".join(batch) for batch in lines]
 
 
 class NeoLightsCtl:
-    def __init__(self):
-        try_to_find_serial = find_all_luxmeters('CH340', 'description')
-        if try_to_find_serial:
-            device = try_to_find_serial[0]
-            print(f"Found device at: {device}")
-        else:
-            raise ValueError("Could not find the serial port of lights...")
+    def __init__(self, conn=None, timeout: float = RESPONSE_TIMEOUT, boot_timeout: float = BOOT_TIMEOUT,
+                 calibration=None):
+        """
+        :param conn: Already open connection to use instead of looking for the lights
+        :param timeout: Seconds to wait for a reply to a query
+        :param boot_timeout: Seconds to wait for the board to answer at all
+        :param calibration: calibration.CalibrationModel used by set_target()
+        """
+        self.calibration = calibration
+        if conn is None:
+            registry = get_registry()
+            registry.register('lights', LIGHTS_KIND)
+            try_to_find_serial = registry.find('lights')
+            if try_to_find_serial:
+                device = try_to_find_serial[0]
+                print(f"Found device at: {device}")
+            else:
+                raise ValueError("Could not find the serial port of lights...")
 
-        baud = 115200
-        try:
-            self.conn = Serial(device, baud)
-        except SerialException:
-            raise ValueError("Could not connect to serial device")
+            try:
+                conn, _ = registry.acquire('lights', device)
+            except SerialException:
+                raise ValueError("Could not connect to serial device")
+        self.conn = conn
+        self.timeout = timeout
 
-        print("Waiting 1 sec while initializing...")
-        sleep(1)
+        self._send_lock = Lock()
+        self.reader = ResponseReader(self.conn, timeout)
+        self.reader.start()
 
         # self.set_brightness(20)
 
-        self.pixels_count = self.get_pixels_count()
+        self.pixels_count = self.wait_ready(boot_timeout)
+        self.frame = None  # Last committed pixels, None while unknown
 
         resp_data = self.get_colors()
         try:
@@ -85,11 +261,38 @@ class NeoLightsCtl:
         # Turn Off Wifi
         self.send_cmd("Wifi 0")
 
-    def read(self):
-        return self.conn.read(self.conn.in_waiting).decode('ascii')
-
+    @metrics.timed("lights.send_cmd")
     def send_cmd(self, cmd: str):
-        self.conn.write(f"{cmd}\n".encode())
+        with self._send_lock:
+            self.reader.expect(count=count_replies(cmd))
+            self.conn.write(f"{cmd}\n".encode())
+
+    @metrics.timed("lights.send_lines")
+    def send_lines(self, cmds: list):
+        """ Send several command lines in one write. """
+        payload = "".join(f"{cmd}\n" for cmd in cmds).encode()
+        with self._send_lock:
+            for cmd in cmds:
+                self.reader.expect(count=count_replies(cmd))
+            self.conn.write(payload)
+
+    @metrics.timed("lights.query")
+    def query(self, cmd: str, key: str, timeout: float = None) -> dict:
+        """
+        Send a command and wait for its reply.
+        :param cmd: Command to send
+        :param key: Key the reply has to contain
+        :param timeout: Seconds to wait, defaults to the controller timeout
+        :return: Dict with the reply
+        """
+        with self._send_lock:
+            entry = self.reader.expect(key)
+            self.conn.write(f"{cmd}\n".encode())
+
+        resp = self.reader.wait(entry, self.timeout if timeout is None else timeout)
+        if key not in resp:
+            raise Exception(f"Got: {resp}")
+        return resp
 
     def send_cmds(self, *cmd_list):
         # When sending multiple commands at once, you might get multiple lines of response
@@ -102,17 +305,65 @@ class NeoLightsCtl:
 
         self.send_cmd(cmd_str)
 
+    def wait_ready(self, boot_timeout: float = BOOT_TIMEOUT) -> int:
+        """
+        Wait for the board to answer, it may still be booting right after the port was opened.
+        :param boot_timeout: Seconds to keep asking
+        :return: Pixels count
+        """
+        deadline = monotonic() + boot_timeout
+        while True:
+            try:
+                return int(self.query("Pixels", 'Pixels', timeout=READY_POLL)['Pixels'])
+            except TimeoutError:
+                metrics.count("lights.retries")
+                if monotonic() >= deadline:
+                    raise ValueError(f"Lights did not answer in {boot_timeout} sec")
+                print("Waiting for the lights to boot...")
+
     def get_pixels_count(self) -> int:
-        self.send_cmd("Pixels")
-        # sleep(2)
-        return int(read_response(self)['Pixels'])
+        return int(self.query("Pixels", 'Pixels')['Pixels'])
 
     def get_colors(self) -> dict:
-        self.send_cmd("HSBColor")
-        return read_response(self)
+        return self.query("HSBColor", 'HSBColor')
 
     def set_led(self, led_num: int, color):
         self.send_cmd(f"Led{led_num} {color}")
+        if self.frame is not None:
+            self.frame[led_num - 1] = pixel_to_hex(color)
+
+    def set_frame(self, pixels) -> int:
+        """
+        Commit a whole frame, sending only the pixels changed since the last committed one.
+        :param pixels: Sequence of pixels_count hex strings or (r, g, b), or a NumPy array of shape (pixels_count, 3)
+        :return: Number of pixels sent
+        """
+        return self.commit_frame(self.prepare_frame(pixels))
+
+    def prepare_frame(self, pixels) -> tuple:
+        """
+        Encode a frame against the last committed one without sending it, see set_frame().
+        :return: (frame, command lines, number of changed pixels) for commit_frame()
+        """
+        if hasattr(pixels, 'tolist'):
+            pixels = pixels.tolist()
+        if len(pixels) != self.pixels_count:
+            raise ValueError(f"Frame must have {self.pixels_count} pixels, got {len(pixels)}!")
+
+        new_frame = [pixel_to_hex(pixel) for pixel in pixels]
+        runs = diff_frame(self.frame, new_frame)
+        return new_frame, pack_led_cmds(runs), sum(len(colors) for _, colors in runs)
+
+    def commit_frame(self, prepared: tuple) -> int:
+        """
+        Send a frame encoded by prepare_frame() in a single write.
+        :return: Number of pixels sent
+        """
+        new_frame, lines, changed = prepared
+        if lines:
+            self.send_lines(lines)
+        self.frame = new_frame
+        return changed
 
     def set_brightness(self, brightness: int):
         if not isinstance(brightness, int) or brightness < 0 or brightness > 100:
@@ -123,18 +374,17 @@ class NeoLightsCtl:
 
     def get_brightness(self, new_read: bool = False):
         if new_read:
-            self.send_cmd("Dimmer")
-            return read_response(self)['Dimmer']
+            return self.query("Dimmer", 'Dimmer')['Dimmer']
         return self.brightness
 
     def set_color(self, color: str):
         self.color = color
+        self.frame = None
         self.send_cmd(f"Color {color}")
 
     def get_color(self, new_read: bool = False):
         if new_read:
-            self.send_cmd("Color")
-            return read_response(self)['Color']
+            return self.query("Color", 'Color')['Color']
         return self.color
 
     def set_channels(self, r: int, g: int, b: int):
@@ -158,22 +408,38 @@ class NeoLightsCtl:
         self.hue = hsb[0]
         self.saturation = hsb[1]
         self.brightness = hsb[2]
+        self.frame = None
 
-        self.send_cmd(f"HSBColor {hsb}")
-
-        resp = read_response(self)
+        resp = self.query(f"HSBColor {hsb}", 'HSBColor')
         self.save_resp_data(resp)
 
     # HueSaturationBrightness
     def get_hsb(self, new_read: bool = False):
         if new_read:
-            self.send_cmd("HSBColor")
-            resp = read_response(self)
+            resp = self.query("HSBColor", 'HSBColor')
 
             self.save_resp_data(resp)
             return resp['HSBColor']
         return self.hue, self.saturation, self.brightness
 
+    def set_target(self, cct: float, lux: float, delta_uv: float = 0.):
+        """
+        Set the light that gives a CCT, Δuv and illuminance, as looked up in the calibration model.
+        :param cct: Correlated colour temperature in Kelvin, e.g. 6500 for daylight
+        :param lux: Illuminance
+        :param delta_uv: Distance from the Planckian locus, e.g. 0.003
+        :return: The HSB or RGB setting that was sent
+        """
+        if self.calibration is None:
+            raise ValueError("Setting a target needs a calibration model!")
+
+        setting = self.calibration.query(cct, lux, delta_uv)
+        if self.calibration.setting == "hsb":
+            self.set_hsb(list(setting))
+        else:
+            self.set_color(pixel_to_hex(setting))
+        return setting
+
     def save_resp_data(self, data: dict):
         try:
             self.power = bool(1 if data['POWER'] == "ON" else 0)
@@ -199,4 +465,5 @@ class NeoLightsCtl:
 
     def __del__(self):
         self.set_brightness(0)
+        self.reader.stop()
         self.conn.close()
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, BrokenBarrierError
+from time import perf_counter
+
+from luxmeters import metrics
+from luxmeters.registry import get_registry
+from neolights_ctl import LIGHTS_KIND, RESPONSE_TIMEOUT, NeoLightsCtl
+
+COMMIT_TIMEOUT = 5.  # Seconds a strip waits at the commit barrier for the others
+
+
+class NeoLightsPool:
+    """
+    Drives several strips as one.
+    Every strip has its own I/O thread, so the links run in parallel. Commits are synchronized:
+    each thread encodes its strip's commands first, then all of them write at the same moment.
+    """
+
+    def __init__(self, lights=None, timeout: float = RESPONSE_TIMEOUT):
+        """
+        :param lights: NeoLightsCtl of each strip, in the order of the logical frame.
+                       By default every lights port found is opened.
+        :param timeout: Seconds to wait for a reply to a query, for the strips opened here
+        """
+        if lights is None:
+            registry = get_registry()
+            registry.register('lights', LIGHTS_KIND)
+            devices = registry.find('lights')
+            if not devices:
+                raise ValueError("Could not find the serial port of lights...")
+            print(f"Found devices at: {devices}")
+
+            # The boards answer their first queries slowly, start them all at once
+            with ThreadPoolExecutor(len(devices)) as executor:
+                lights = list(executor.map(
+                    lambda device: NeoLightsCtl(registry.acquire('lights', device)[0], timeout), devices))
+
+        self.lights = list(lights)
+        if not self.lights:
+            raise ValueError("The pool needs at least one strip!")
+        self.pixels_count = sum(light.pixels_count for light in self.lights)
+        self.last_skew = None
+
+        self._executors = [ThreadPoolExecutor(1, thread_name_prefix=f"strip-{num}")
+                           for num in range(len(self.lights))]
+
+    def __len__(self) -> int:
+        return len(self.lights)
+
+    def map(self, func) -> list:
+        """
+        Run func(light) for every strip on its I/O thread, without synchronizing them.
+        :return: Results in the order of the strips
+        """
+        futures = [executor.submit(func, light) for executor, light in zip(self._executors, self.lights)]
+        return [future.result() for future in futures]
+
+    def commit(self, prepare, send) -> list:
+        """
+        Change all strips at once.
+        Each strip's I/O thread runs prepare(num, light), waits for the others to finish theirs,
+        then runs send(light, prepared), which should only write.
+        The skew between the first and the last strip finishing send is kept in last_skew.
+        :return: Results of send in the order of the strips
+        """
+        barrier = Barrier(len(self.lights), timeout=COMMIT_TIMEOUT)
+        sent_at = [None] * len(self.lights)
+
+        def run(num, light):
+            try:
+                prepared = prepare(num, light)
+            except Exception:
+                barrier.abort()
+                raise
+            barrier.wait()
+            result = send(light, prepared)
+            sent_at[num] = perf_counter()
+            return result
+
+        futures = [executor.submit(run, num, light)
+                   for num, (executor, light) in enumerate(zip(self._executors, self.lights))]
+        try:
+            results = [future.result() for future in futures]
+        except BrokenBarrierError:
+            # Another strip failed to prepare, its error is the one worth raising
+            for future in futures:
+                if future.exception() and not isinstance(future.exception(), BrokenBarrierError):
+                    raise future.exception()
+            raise
+
+        self.last_skew = max(sent_at) - min(sent_at)
+        metrics.observe("pool.commit_skew", self.last_skew)
+        return results
+
+    def split_frame(self, pixels) -> list:
+        """ Cut a logical frame of all strips' pixels, in strip order, into a frame per strip. """
+        if len(pixels) != self.pixels_count:
+            raise ValueError(f"Frame must have {self.pixels_count} pixels, got {len(pixels)}!")
+
+        frames = list()
+        start = 0
+        for light in self.lights:
+            frames.append(pixels[start:start + light.pixels_count])
+            start += light.pixels_count
+        return frames
+
+    def set_frame(self, pixels) -> int:
+        """
+        Commit a logical frame across all strips, see NeoLightsCtl.set_frame().
+        :param pixels: Sequence or NumPy array of pixels_count pixels, the first strip's pixels first
+        :return: Number of pixels sent
+        """
+        return self.set_frames(self.split_frame(pixels))
+
+    def set_frames(self, frames) -> int:
+        """
+        Commit a frame per strip at once.
+        :param frames: Frame of each strip in strip order
+        :return: Number of pixels sent
+        """
+        if len(frames) != len(self.lights):
+            raise ValueError(f"Need a frame for each of the {len(self.lights)} strips, got {len(frames)}!")
+        return sum(self.commit(lambda num, light: light.prepare_frame(frames[num]),
+                               lambda light, prepared: light.commit_frame(prepared)))
+
+    def set_color(self, color: str):
+        self.commit(lambda num, light: color, lambda light, prepared: light.set_color(prepared))
+
+    def set_hsb(self, hsb: list):
+        self.commit(lambda num, light: hsb, lambda light, prepared: light.set_hsb(prepared))
+
+    def set_brightness(self, brightness: int):
+        self.commit(lambda num, light: brightness, lambda light, prepared: light.set_brightness(prepared))
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown()
@@ -0,0 +1,91 @@
+from colorsys import hsv_to_rgb
+from json import dumps
+from time import monotonic
+
+from luxmeters.simulators import SimulatedSerial
+
+
+class TasmotaSimulator(SimulatedSerial):
+    """
+    Stand-in for a Tasmota NeoPixel controller on a serial link.
+    Answers with "RESULT = {...}" lines the way the firmware's serial log does.
+    Commands of a plain Backlog run backlog_delay apart like SetOption34, Backlog0 runs them at once.
+    """
+
+    def __init__(self, pixels_count=60, latency=.005, jitter=0., baudrate=115200, timeout=.1,
+                 backlog_delay=.2, **kwargs):
+        super().__init__(latency=latency, jitter=jitter, baudrate=baudrate, timeout=timeout, **kwargs)
+        self.backlog_delay = backlog_delay
+        self.pixels = ["000000"] * pixels_count
+        self.power = True
+        self.dimmer = 100
+        self.hsb = [0, 0, 100]
+        self.color = "FFFFFF"
+        self.commands = 0
+        self._started = monotonic()
+
+    def _state(self) -> dict:
+        channel = [round(int(self.color[i:i + 2], 16) / 2.55) for i in (0, 2, 4)]
+        return {"POWER": "ON" if self.power else "OFF", "Dimmer": self.dimmer, "Color": self.color,
+                "HSBColor": ",".join(str(v) for v in self.hsb), "Channel": channel}
+
+    def _set_hsb(self, hue, sat, bri):
+        self.hsb = [hue, sat, bri]
+        self.dimmer = bri
+        r, g, b = hsv_to_rgb(hue / 360, sat / 100, bri / 100)
+        self.color = f"{round(r * 255):02X}{round(g * 255):02X}{round(b * 255):02X}"
+        self.pixels = [self.color] * len(self.pixels)
+
+    def _result(self, data: dict, delay=None):
+        clock = monotonic() - self._started
+        stamp = f"{int(clock // 3600):02d}:{int(clock // 60 % 60):02d}:{clock % 60:06.3f}"
+        self.respond(f"{stamp} RSL: RESULT = {dumps(data)}\r\n".encode('ascii'), delay)
+
+    def execute(self, cmd: str) -> dict:
+        name, _, value = cmd.strip().partition(' ')
+        value = value.strip()
+        lname = name.lower()
+
+        if lname == "pixels":
+            if value:
+                self.pixels = (self.pixels + ["000000"] * int(value))[:int(value)]
+            return {"Pixels": len(self.pixels)}
+        if lname == "hsbcolor":
+            if value:
+                hsb = [int(v) for v in value.strip('[]').split(',')]
+                self._set_hsb(*hsb)
+            return self._state()
+        if lname == "color":
+            if value:
+                self.color = value.lstrip('#').upper()[:6]
+                self.pixels = [self.color] * len(self.pixels)
+            return self._state()
+        if lname == "dimmer":
+            if value:
+                self.dimmer = int(value)
+                self.hsb[2] = self.dimmer
+            return self._state()
+        if lname.startswith("channel") and lname[7:].isdigit():
+            return self._state()
+        if lname.startswith("led") and lname[3:].isdigit():
+            start = int(lname[3:]) - 1
+            colors = [c.lstrip('#').upper() for c in value.split()]
+            for num, color in enumerate(colors):
+                if start + num < len(self.pixels):
+                    self.pixels[start + num] = color
+            return {name: self.pixels[start] if start < len(self.pixels) else ""}
+        if lname == "wifi":
+            return {"Wifi": "OFF" if value == "0" else "ON"}
+        return {"Command": "Unknown"}
+
+    def handle_line(self, line: bytes) -> None:
+        line = line.decode('ascii', errors='replace').strip()
+        if not line:
+            return
+
+        name, _, rest = line.partition(' ')
+        cmds = rest.split(';') if name.lower() in ("backlog", "backlog0") else [line]
+        gap = self.backlog_delay if name.lower() == "backlog" else 0.
+        for num, cmd in enumerate(c for c in cmds if c.strip()):
+            self.commands += 1
+            self._result(self.execute(cmd), self.latency + self._random.uniform(0, self.jitter) + num * gap)
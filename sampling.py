@@ -0,0 +1,277 @@
+from itertools import product
+from json import dumps, loads
+from os.path import exists
+from threading import Condition
+
+MEASURED_FIELDS = ("EV", "TCP", "deltaUV")
+
+
+def record_values(data: dict):
+    """ The measured fields a strategy cares about, None if the record has none of them. """
+    values = {key: data[key] for key in MEASURED_FIELDS if data and key in data}
+    return values if values else None
+
+
+class Strategy:
+    """
+    Base sampling strategy: yields integer coordinates within bounds, each one once.
+    Measured values are fed back through feed(), possibly from another thread.
+    """
+    name = None
+
+    def __init__(self, bounds):
+        """
+        :param bounds: List of inclusive (low, high) per dimension
+        """
+        self.bounds = [(int(low), int(high)) for low, high in bounds]
+        self.measured = dict()
+        self._cond = Condition()
+
+    def describe(self) -> dict:
+        """ Everything the sequence depends on, a checkpoint is only valid for the same description. """
+        return {"strategy": self.name, "bounds": self.bounds}
+
+    def feed(self, coords, values):
+        with self._cond:
+            self.measured[tuple(coords)] = values
+            self._cond.notify_all()
+
+    def wait_measured(self, coords_list, timeout: float) -> None:
+        """ Wait until the given points got their values, points that failed to measure are given up on timeout. """
+        with self._cond:
+            self._cond.wait_for(lambda: all(coords in self.measured for coords in coords_list), timeout)
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+class GridStrategy(Strategy):
+    """
+    Coarse-to-fine grid: the whole range at a big step first, then every level halves the step
+    and adds only the points not visited yet. Stopping early still leaves an evenly spread map.
+    """
+    name = "grid"
+
+    def __init__(self, bounds, start_step: int = 32, min_step: int = 1):
+        super().__init__(bounds)
+        self.start_step = start_step
+        self.min_step = min_step
+
+    def describe(self) -> dict:
+        return dict(super().describe(), start_step=self.start_step, min_step=self.min_step)
+
+    def axes(self, step: int) -> list:
+        return [list(range(low, high + 1, step)) + ([high] if (high - low) % step else []) for low, high in self.bounds]
+
+    def level(self, step: int) -> list:
+        return list(product(*self.axes(step)))
+
+    def __iter__(self):
+        # A point was visited if a coarser level had all its coordinates, no need to keep every point
+        coarser = list()
+        step = self.start_step
+        while step >= self.min_step:
+            axes = self.axes(step)
+            for coords in product(*axes):
+                if not any(all(c in axis for c, axis in zip(coords, level)) for level in coarser):
+                    yield coords
+            coarser.append([set(axis) for axis in axes])
+            step //= 2
+
+
+def radical_inverse(index: int, base: int) -> float:
+    result = 0.
+    fraction = 1.
+    while index > 0:
+        fraction /= base
+        result += fraction * (index % base)
+        index //= base
+    return result
+
+
+class _LowDiscrepancyStrategy(Strategy):
+    def __init__(self, bounds, count: int = 1024):
+        super().__init__(bounds)
+        self.count = count
+
+    def describe(self) -> dict:
+        return dict(super().describe(), count=self.count)
+
+    def unit_points(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        total = 1
+        for low, high in self.bounds:
+            total *= high - low + 1
+
+        visited = set()
+        for unit in self.unit_points():
+            if len(visited) >= min(self.count, total):
+                return
+            coords = tuple(round(low + u * (high - low)) for u, (low, high) in zip(unit, self.bounds))
+            if coords not in visited:
+                visited.add(coords)
+                yield coords
+
+
+class HaltonStrategy(_LowDiscrepancyStrategy):
+    """ Halton sequence, spreads count points evenly over the whole range in any order prefix. """
+    name = "halton"
+    primes = (2, 3, 5, 7, 11, 13)
+
+    def unit_points(self):
+        index = 1
+        while True:
+            yield [radical_inverse(index, base) for base in self.primes[:len(self.bounds)]]
+            index += 1
+
+
+class SobolStrategy(_LowDiscrepancyStrategy):
+    """ Sobol sequence, needs scipy >= 1.7. """
+    name = "sobol"
+
+    def unit_points(self):
+        try:
+            from scipy.stats.qmc import Sobol
+        except ImportError:
+            raise ImportError("Sobol sampling needs scipy >= 1.7, use HaltonStrategy otherwise")
+
+        sampler = Sobol(len(self.bounds), scramble=False)
+        while True:
+            yield from sampler.random(256).tolist()
+
+
+class RefineStrategy(GridStrategy):
+    """
+    Adaptive refinement: starts with a coarse grid, then only halves the step around points
+    whose measured CCT, lux or Δuv changes faster than the tolerances between grid neighbours.
+    """
+    name = "refine"
+
+    def __init__(self, bounds, start_step: int = 16, min_step: int = 1,
+                 cct_tolerance: float = 50., lux_tolerance: float = .05, duv_tolerance: float = .002,
+                 wait_timeout: float = 60.):
+        """
+        :param cct_tolerance: Kelvins between neighbours that are fine
+        :param lux_tolerance: Relative lux change between neighbours that is fine
+        :param duv_tolerance: Δuv change between neighbours that is fine
+        :param wait_timeout: Seconds to wait for a level to be measured before refining it
+        """
+        super().__init__(bounds, start_step, min_step)
+        self.cct_tolerance = cct_tolerance
+        self.lux_tolerance = lux_tolerance
+        self.duv_tolerance = duv_tolerance
+        self.wait_timeout = wait_timeout
+
+    def describe(self) -> dict:
+        return dict(super().describe(), cct_tolerance=self.cct_tolerance, lux_tolerance=self.lux_tolerance,
+                    duv_tolerance=self.duv_tolerance)
+
+    def change(self, a: dict, b: dict) -> float:
+        """ Biggest change between two measurements, in tolerances. """
+        if not a or not b:
+            return 0.
+
+        changes = [0.]
+        if "TCP" in a and "TCP" in b:
+            changes.append(abs(a["TCP"] - b["TCP"]) / self.cct_tolerance)
+        if "EV" in a and "EV" in b:
+            changes.append(abs(a["EV"] - b["EV"]) / max(abs(a["EV"]), abs(b["EV"]), 1e-9) / self.lux_tolerance)
+        if "deltaUV" in a and "deltaUV" in b:
+            changes.append(abs(a["deltaUV"] - b["deltaUV"]) / self.duv_tolerance)
+        return max(changes)
+
+    def in_bounds(self, coords) -> bool:
+        return all(low <= c <= high for c, (low, high) in zip(coords, self.bounds))
+
+    def needs_refining(self, coords, step: int) -> bool:
+        values = self.measured.get(coords)
+        for axis in range(len(coords)):
+            for direction in (-step, step):
+                neighbour = list(coords)
+                neighbour[axis] += direction
+                if self.change(values, self.measured.get(tuple(neighbour))) > 1:
+                    return True
+        return False
+
+    def __iter__(self):
+        visited = set()
+        level = self.level(self.start_step)
+        step = self.start_step
+        while True:
+            for coords in level:
+                if coords not in visited:
+                    visited.add(coords)
+                    yield coords
+
+            if step // 2 < self.min_step:
+                return
+
+            self.wait_measured(level, self.wait_timeout)
+            half = step // 2
+            next_level = list()
+            for coords in level:
+                if not self.needs_refining(coords, step):
+                    continue
+                for offsets in product((-half, 0, half), repeat=len(coords)):
+                    new_coords = tuple(c + o for c, o in zip(coords, offsets))
+                    if self.in_bounds(new_coords):
+                        next_level.append(new_coords)
+
+            if not next_level:
+                return
+            level = list(dict.fromkeys(next_level))
+            step = half
+
+
+class Checkpoint:
+    """
+    Append-only record of the measured points of a sweep, one JSON line per point,
+    so a sweep can resume after a crash or a restart.
+    """
+
+    def __init__(self, path: str, description: dict):
+        """
+        :param path: File of the checkpoint, created if it does not exist
+        :param description: Strategy.describe() of the sweep, has to match the one stored in the file
+        """
+        self.path = path
+        self.done = dict()
+        description = loads(dumps(description))  # Tuples come back as lists
+
+        if exists(path):
+            with open(path, 'r') as f:
+                lines = f.read().splitlines()
+            header = loads(lines[0]) if lines else None
+            if header != description:
+                raise ValueError(f"Checkpoint {path} belongs to a different sweep: {header}")
+            valid = 1
+            for line in lines[1:]:
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    break  # Line cut short by a crash
+                self.done[tuple(entry["coords"])] = entry["values"]
+                valid += 1
+
+            if valid < len(lines):
+                with open(path, 'w') as f:
+                    f.write(''.join(line + '\n' for line in lines[:valid]))
+            self._file = open(path, 'a', 1)
+        else:
+            self._file = open(path, 'w', 1)
+            self._file.write(dumps(description) + '\n')
+
+        if self.done:
+            print(f"Resuming from checkpoint {path}, {len(self.done)} points done")
+
+    def __contains__(self, coords) -> bool:
+        return tuple(coords) in self.done
+
+    def add(self, coords, values):
+        self.done[tuple(coords)] = values
+        self._file.write(dumps({"coords": list(coords), "values": values}) + '\n')
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,76 @@
+from collections import deque
+from time import sleep, monotonic
+
+# Sensor.get() readings of the CL-200A are (EV, TCP, Δuv) with a display step of 0.1 each,
+# TCP in tens of Kelvin and Δuv in thousandths. A one step flicker has to pass, with room for float error.
+ABS_TOLERANCE = (.15, .15, .15)
+
+
+class SettleDetector:
+    """
+    Decides when the light and the sensor settled after a change,
+    by watching consecutive sensor readings instead of waiting a fixed time.
+    """
+
+    def __init__(self, tolerance: float = .005, abs_tolerance=ABS_TOLERANCE, window: int = 2,
+                 min_wait: float = .1, max_wait: float = 2., poll: float = 0.):
+        """
+        :param tolerance: Allowed spread of each value within the window, relative to the latest reading
+        :param abs_tolerance: Allowed spread for values close to 0, in the units of the readings.
+                              A number for all values or one per value of a reading, the last one
+                              covers any further values
+        :param window: Number of consecutive readings that have to agree
+        :param min_wait: Seconds to wait after the change before the first reading
+        :param max_wait: Seconds after which the latest reading is taken as it is
+        :param poll: Seconds to sleep between readings, for sensors that return instantly
+        """
+        if window < 1:
+            raise ValueError("Window must be at least 1 reading!")
+        if min_wait > max_wait:
+            raise ValueError("min_wait can not be bigger than max_wait!")
+
+        self.tolerance = tolerance
+        self.abs_tolerance = abs_tolerance
+        self.window = window
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.poll = poll
+
+    def is_stable(self, readings) -> bool:
+        if len(readings) < self.window:
+            return False
+
+        abs_tolerances = self.abs_tolerance if isinstance(self.abs_tolerance, (tuple, list)) else (self.abs_tolerance,)
+        for num, values in enumerate(zip(*readings)):
+            abs_tolerance = abs_tolerances[min(num, len(abs_tolerances) - 1)]
+            allowed = max(self.tolerance * abs(values[-1]), abs_tolerance)
+            if max(values) - min(values) > allowed:
+                return False
+        return True
+
+    def wait(self, read) -> tuple:
+        """
+        Read the sensor until the readings settle.
+        :param read: Callable returning a reading - a number or a tuple of numbers, None if it failed
+        :return: (last reading, seconds it took to settle, whether it settled before max_wait)
+        """
+        start = monotonic()
+        sleep(self.min_wait)
+
+        readings = deque(maxlen=self.window)
+        reading = None
+        while True:
+            new_reading = read()
+            elapsed = monotonic() - start
+
+            if new_reading is not None:
+                reading = new_reading
+                readings.append(tuple(reading) if isinstance(reading, (tuple, list)) else (reading,))
+                if self.is_stable(readings):
+                    return reading, elapsed, True
+
+            if elapsed >= self.max_wait:
+                return reading, elapsed, False
+
+            if self.poll:
+                sleep(self.poll)
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Thread
+from time import sleep, monotonic
+
+from luxmeters import metrics
+from settle import SettleDetector
+
+
+def merge_readings(readings: dict) -> dict:
+    """
+    Merge the records of several meters taken at the same point into one.
+    Fields clashing with an earlier meter's get prefixed with the meter name.
+    """
+    record = dict()
+    for name, data in readings.items():
+        for key, value in data.items():
+            record[key if key not in record else f"{name}_{key}"] = value
+    return record
+
+
+class SweepEngine:
+    """
+    Runs light/sensor sweeps as a pipeline:
+    - the main thread sets the light, waits for the first meter's readings to settle and triggers the other meters,
+    - each meter has its own worker thread, so all meters measure the same point in parallel
+      and read their data out while the light already moves to the next point,
+    - a writer thread hands the merged records to on_record in the order of the points.
+    """
+
+    def __init__(self, sensors: dict = None, settle: SettleDetector = None, on_record=None, queue_size: int = 16):
+        """
+        :param sensors: Dict of name: Sensor, the first one is watched for settling
+        :param settle: SettleDetector, default one if not given
+        :param on_record: Callable taking (point, data, settle_time), returning -1 for rejected records
+        :param queue_size: Points that may wait for persisting before the sweep is held back
+        """
+        self.sensors = dict(sensors) if sensors else dict()
+        self.settle = settle if settle else SettleDetector()
+        self.on_record = on_record
+        self.queue_size = queue_size
+
+        # A single worker per meter keeps its commands in order
+        self._executors = {name: ThreadPoolExecutor(1, thread_name_prefix=f"sensor-{name}") for name in self.sensors}
+
+    def _wait_settle(self) -> float:
+        if not self.sensors:
+            sleep(self.settle.max_wait)
+            return self.settle.max_wait
+
+        name, sensor = next(iter(self.sensors.items()))
+        executor = self._executors[name]
+
+        _, settle_time, settled = self.settle.wait(lambda: executor.submit(sensor.get).result())
+        if not settled:
+            print(f"Readings did not settle in {settle_time:.2f} sec")
+        return settle_time
+
+    def _capture(self) -> dict:
+        # The watched meter holds the settled reading already, only the others need a trigger
+        triggers = [self._executors[name].submit(sensor.trigger) for name, sensor in list(self.sensors.items())[1:]]
+        for trigger in triggers:
+            trigger.result()
+
+        return {name: self._executors[name].submit(sensor.record) for name, sensor in self.sensors.items()}
+
+    def _persist(self, queue: Queue, stats: dict, failure: list):
+        try:
+            self._persist_records(queue, stats)
+        except Exception as err:
+            # Handed back to run(), which stops the sweep
+            failure.append(err)
+
+    def _persist_records(self, queue: Queue, stats: dict):
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+
+            point, settle_time, futures = item
+            try:
+                with metrics.Timer("sweep.readout"):
+                    data = merge_readings({name: future.result() for name, future in futures.items()})
+            except Exception as err:
+                print(f"Reading {point} failed: {err}")
+                stats["errors"] += 1
+                metrics.count("sweep.errors")
+                continue
+
+            with metrics.Timer("sweep.persist"):
+                res = self.on_record(point, data, settle_time) if self.on_record else 1
+            if res == -1:
+                stats["rejected"] += 1
+            else:
+                stats["saved"] += 1
+
+    def run(self, points, apply) -> dict:
+        """
+        Sweep through points.
+        :param points: Iterable of points, passed to apply and on_record as they are
+        :param apply: Callable setting the light to a point
+        :return: Dict with points, saved, rejected, errors and duration of the sweep.
+                 An exception raised by on_record stops the sweep and is raised here.
+        """
+        stats = {"points": 0, "saved": 0, "rejected": 0, "errors": 0}
+        queue = Queue(self.queue_size)
+        failure = list()
+        writer = Thread(target=self._persist, args=(queue, stats, failure), daemon=True)
+        writer.start()
+
+        def put(item) -> bool:
+            # A dead writer never takes anything out of the queue again
+            while writer.is_alive():
+                try:
+                    queue.put(item, timeout=.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        start = monotonic()
+        try:
+            for point in points:
+                if failure:
+                    break
+                with metrics.Timer("sweep.apply"):
+                    apply(point)
+                with metrics.Timer("sweep.settle"):
+                    settle_time = self._wait_settle()
+                with metrics.Timer("sweep.capture"):
+                    futures = self._capture() if self.sensors else dict()
+                # Time spent here means the writer fell behind
+                with metrics.Timer("sweep.queue_wait"):
+                    if not put((point, settle_time, futures)):
+                        break
+                stats["points"] += 1
+        finally:
+            put(None)
+            writer.join()
+
+        if failure:
+            raise failure[0]
+        stats["duration"] = monotonic() - start
+        return stats
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown()